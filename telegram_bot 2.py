@@ -1,9 +1,19 @@
 import logging
+import logging.handlers
 import os
+import queue
+import atexit
 import datetime
 import json
 import re
+import time
+import random
+import functools
+import threading
 import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Literal, Optional
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from telegram.ext import (
@@ -14,12 +24,16 @@ from telegram.ext import (
 load_dotenv()
 
 # Configure logging
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-    filename='bot.log',  # Добавляем запись логов в файл
-    filemode='a'
-)
+# Запись в файл выполняет QueueListener в отдельном потоке, обработчики только кладут записи в очередь
+_log_queue = queue.Queue(-1)
+_log_file_handler = logging.FileHandler('bot.log', mode='a', encoding='utf-8')
+_log_file_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_file_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+_root_logger = logging.getLogger()
+_root_logger.setLevel(logging.INFO)
+_root_logger.addHandler(logging.handlers.QueueHandler(_log_queue))
 logger = logging.getLogger(__name__)
 # Configuration
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
@@ -37,6 +51,8 @@ if not OPENAI_API_KEY and OPENAI_LIB_AVAILABLE:
 # Attempt to import external libraries
 try:
     import gspread
+    from gspread.exceptions import APIError
+    from requests.exceptions import RequestException
     from google.oauth2.service_account import Credentials
     GOOGLE_LIBS_AVAILABLE = True
 except ImportError:
@@ -45,24 +61,86 @@ except ImportError:
 
 try:
     import openai
+    import httpx
     OPENAI_LIB_AVAILABLE = True
 except ImportError:
     OPENAI_LIB_AVAILABLE = False
     logging.warning("OpenAI library not found. GPT-4o functionality disabled.")
 
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 # Initialize OpenAI client
 openai_client = None
 if OPENAI_LIB_AVAILABLE and OPENAI_API_KEY:
     try:
-        openai_client = openai.OpenAI(api_key=OPENAI_API_KEY)
+        # Асинхронный клиент с пулом HTTP/2-соединений, переиспользуемых между запросами
+        openai_client = openai.AsyncOpenAI(
+            api_key=OPENAI_API_KEY,
+            http_client=httpx.AsyncClient(
+                http2=True,
+                timeout=30,
+                limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)
+            )
+        )
         logger.info("OpenAI client initialized successfully.")
     except Exception as e:
         logger.error(f"Failed to initialize OpenAI client: {e}")
+# Системный промпт GPT: собирается один раз при загрузке модуля и всегда идёт первым сообщением
+GPT_SYSTEM_PROMPT = """\
+Ты — интеллектуальный агент, виртуальный администратор группы IT Oiltech компании SRL Oiltech.
+Твоя цель: контролировать тематическую чистоту чата (разрешены только вопросы, связанные с технической поддержкой, ИТ-инфраструктурой и обслуживанием), определять категорию сообщения и действие, которое нужно выполнить.
+
+Как ты работаешь:
+1. Получаешь сообщение из группы.
+2. Извлекаешь суть, игнорируя имена, обращения и ненужные детали.
+3. Определяешь категорию сообщения из списка ниже.
+4. Определяешь действие на основе контекста:
+   - "create_task": Создать задачу для ИТ-тематики.
+   - "check_status": Проверить статус задач (если запрашивается, например, "Задача выполнена" или "ID 123 готово").
+   - "mark_done": Отметить задачу как выполненную (если указано, например, "Задача выполнена" или "ID 123 готово").
+   - "offtopic": Сообщение не по теме, удалить и уведомить пользователя.
+   - "show_rules": Показать правила чата (если запрошены, например, "Какие темы можно обсуждать?").
+   - "complain": Обработать жалобу (если содержит "жалоба", "проблема с модерацией").
+5. Возвращаешь JSON с категорией и действием, например:
+   {"category": "🖨 Принтер / Сканер / Картриджи", "action": "create_task", "entities": {"description": "Принтер не печатает"}}
+   {"category": "📌 Другое / Не по теме", "action": "offtopic"}
+   {"category": "📌 Другое / Не по теме", "action": "show_rules"}
+   {"category": "📌 Другое / Не по теме", "action": "complain", "entities": {"complaint_text": "Жалоба на модерацию"}}
+
+Запрещено в чате:
+- Разговоры не по теме (погода, обсуждения, конфликты, жалобы, личные разговоры).
+- Мемы, шутки, флуд, голосовые сообщения.
+- Просьбы без ИТ-содержания.
+
+Категории:
+- 📨 Почта / Office / Outlook / Teams (почта, Teams, Office365)
+- 🖨 Принтер / Сканер / Картриджи (проблемы с принтерами, сканерами, картриджами)
+- 💾 Программы (1С, AutoCAD, др.) (установка, обновление, ошибки)
+- 🔧 Компьютеры и ноутбуки (устройства, драйверы, мониторы, периферия)
+- 🌐 Интернет / Сеть / Кабели (интернет, Wi-Fi, кабели, порты)
+- 🚪 Пропуска / СКУД / Видеонаблюдение (доступ, камеры, турникеты)
+- 👤 Доступы / Учетки / Замена сотрудников (учётные записи, пароли)
+- 📌 Другое / Не по теме (флуд, личные вопросы, оффтоп)
+"""
+# Короткий промпт для предварительной классификации дешёвой моделью
+QUICK_CLASSIFY_PROMPT = """\
+Ты фильтруешь сообщения в чате ИТ-поддержки компании. Ответь одним словом:
+- it — сообщение о технике, программах, почте, сети, пропусках, доступах, о задачах ИТ-отдела и их статусе, вопрос о правилах чата или жалоба;
+- offtopic — всё остальное (приветствия, благодарности, погода, личные разговоры, шутки, флуд).
+"""
+# LRU-кэш ответов GPT по нормализованному тексту сообщения
+_gpt_cache = OrderedDict()
+_GPT_MAX = 2048
 # In-memory storage
-BOT_DATA = {
-    "sysadmin_telegram_id": None,
-    "sysadmin_telegram_username": None,
-    "task_type_deadlines": {
+@dataclass(slots=True)
+class BotData:
+    sysadmin_telegram_id: Optional[int] = None
+    sysadmin_telegram_username: Optional[str] = None
+    task_type_deadlines: dict[str, int] = field(default_factory=lambda: {
         "default": 24,
         "📨 Почта / Office / Outlook / Teams": 8,
         "🖨 Принтер / Сканер / Картриджи": 4,
@@ -71,12 +149,51 @@ BOT_DATA = {
         "🌐 Интернет / Сеть / Кабели": 6,
         "🚪 Пропуска / СКУД / Видеонаблюдение": 4,
         "👤 Доступы / Учетки / Замена сотрудников": 2
-    },
-    "user_violations": {}
-}
+    })
+    user_violations: dict[int, int] = field(default_factory=dict)
+
+BOT_DATA = BotData()
 
 # Conversation states
 CONFIRM_TASK = 0
+# ID постановщика в поле "Имя (123456)"
+_CREATOR_ID_RE = re.compile(r'\((\d+)\)$')
+# Повтор запросов к Google Sheets при превышении квоты и временных ошибках сервера
+_SHEETS_RETRY_STATUSES = (429, 500, 502, 503, 504)
+_SHEETS_MAX_RETRIES = 6
+
+def _is_transient_sheets_error(e, idempotent=True):
+    """Квота, ошибка сервера или сети — запрос имеет смысл повторить.
+
+    Неидемпотентные запросы (append) повторяем только при 429: после 5xx или обрыва
+    соединения строки могли уже записаться на лист.
+    """
+    if isinstance(e, APIError):
+        status = e.response.status_code
+        return status == 429 or (idempotent and status in _SHEETS_RETRY_STATUSES)
+    return idempotent and isinstance(e, (RequestException, ConnectionError, TimeoutError))
+
+def _is_ambiguous_append_error(e):
+    """Ошибка, после которой неизвестно, записал ли сервер строки (5xx, сеть)."""
+    return _is_transient_sheets_error(e) and not _is_transient_sheets_error(e, idempotent=False)
+
+def with_backoff(fn, idempotent=True, attempts=_SHEETS_MAX_RETRIES):
+    """Повторяет вызов при временных ошибках (_is_transient_sheets_error) с экспоненциальной задержкой и джиттером."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        delay = 1
+        for attempt in range(attempts):
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if not _is_transient_sheets_error(e, idempotent) or attempt == attempts - 1:
+                    raise
+                pause = delay + random.random()
+                logger.warning(f"Google Sheets request failed ({e!r}), retrying in {pause:.1f}s")
+                time.sleep(pause)
+                delay = min(delay * 2, 30)
+    return wrapper
+
 # Google Sheets Manager
 class GoogleSheetsManager:
     def __init__(self, credentials_file_path, spreadsheet_id):
@@ -84,6 +201,25 @@ class GoogleSheetsManager:
         self.creds = None
         self.client = None
         self.sheet = None
+        self.tasks_sheet = None
+        self.offtopic_sheet = None
+        self.complaints_sheet = None
+        # Кэш записей листа Tasks (get_all_records), обновляется не чаще раза в max_age секунд
+        self._records_cache = None
+        self._cache_ts = 0
+        # Строки, ожидающие отправки одним append_rows фоновой задачей _flusher
+        self._pending = {"tasks": [], "offtopic": [], "complaints": []}
+        self._flusher_task = None
+        # Сколько строк в начале каждой очереди уже отправлялись, но с неизвестным исходом
+        self._unconfirmed = {"tasks": 0, "offtopic": 0, "complaints": 0}
+        # _pending_lock защищает очереди и кэш (держится только на время операций в памяти),
+        # _write_lock упорядочивает отправку очередей, обновление кэша и статусов в рабочих потоках
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        # Следующий ID задачи: читается с листа один раз (при старте или, после сбоя, перед первой задачей)
+        # и далее увеличивается локально; None — ещё не прочитан
+        self._next_task_id = None
+        self._task_id_lock = threading.Lock()
         self.header = ["ID Задачи", "Описание Задачи", "Дата Постановки", "Категория",
                        "Срок Выполнения (план)", "Статус", "Исполнитель (ID)",
                        "Дата Факт. Выполнения", "ID Сообщения Задачи",
@@ -103,114 +239,339 @@ class GoogleSheetsManager:
             scopes = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
             self.creds = Credentials.from_service_account_file(credentials_file_path, scopes=scopes)
             self.client = gspread.authorize(self.creds)
-            self.sheet = self.client.open_by_key(spreadsheet_id)
-
-            # Инициализация листов
-            self.tasks_sheet = self.sheet.worksheet("Tasks") if "Tasks" in [ws.title for ws in self.sheet.worksheets()] else self.sheet.add_worksheet("Tasks", 1000, 20)
-            self.offtopic_sheet = self.sheet.worksheet("OfftopicLog") if "OfftopicLog" in [ws.title for ws in self.sheet.worksheets()] else self.sheet.add_worksheet("OfftopicLog", 1000, 10)
-            self.complaints_sheet = self.sheet.worksheet("Complaints") if "Complaints" in [ws.title for ws in self.sheet.worksheets()] else self.sheet.add_worksheet("Complaints", 1000, 10)
-
-            # Проверка заголовков
-            if not self.tasks_sheet.row_values(1):
-                self.tasks_sheet.append_row(self.header)
-            if not self.offtopic_sheet.row_values(1):
-                self.offtopic_sheet.append_row(self.offtopic_header)
-            if not self.complaints_sheet.row_values(1):
-                self.complaints_sheet.append_row(self.complaints_header)
-
+            self.sheet = with_backoff(self.client.open_by_key)(spreadsheet_id)
+
+            # Инициализация листов (один запрос списка листов)
+            ws_by_title = {ws.title: ws for ws in with_backoff(self.sheet.worksheets)()}
+            self.tasks_sheet = ws_by_title.get("Tasks") or with_backoff(self.sheet.add_worksheet)("Tasks", 1000, 20)
+            self.offtopic_sheet = ws_by_title.get("OfftopicLog") or with_backoff(self.sheet.add_worksheet)("OfftopicLog", 1000, 10)
+            self.complaints_sheet = ws_by_title.get("Complaints") or with_backoff(self.sheet.add_worksheet)("Complaints", 1000, 10)
+
+            # Проверка заголовков (первые строки всех листов одним запросом)
+            header_ranges = with_backoff(self.sheet.values_batch_get)(["Tasks!1:1", "OfftopicLog!1:1", "Complaints!1:1"])
+            for value_range, worksheet, header in zip(
+                    header_ranges.get("valueRanges", []),
+                    [self.tasks_sheet, self.offtopic_sheet, self.complaints_sheet],
+                    [self.header, self.offtopic_header, self.complaints_header]):
+                if not value_range.get("values"):
+                    with_backoff(worksheet.append_row)(header)
+
+            self._next_task_id = self._load_next_task_id()
             logger.info("Connected to Google Sheets API.")
         except Exception as e:
             logger.error(f"Failed to connect to Google Sheets: {e}")
             self.sheet = None
+            self.tasks_sheet = None
+            self.offtopic_sheet = None
+            self.complaints_sheet = None
 
-    def _get_next_task_id(self):
+    @with_backoff
+    def _get_records(self, max_age=30):
+        """Возвращает записи листа Tasks из кэша, перечитывая лист только при устаревании."""
         if not self.tasks_sheet:
-            return 1
+            return []
+        if not self._records_fresh(max_age):
+            # Под _write_lock чтение листа не пересекается с отправкой очереди,
+            # иначе строки «в пути» пропали бы из кэша и сдвинули номера строк
+            with self._write_lock:
+                if not self._records_fresh(max_age):
+                    records = [self._with_deadline(r) for r in self.tasks_sheet.get_all_records()]
+                    sheet_ids = {str(r.get("ID Задачи")) for r in records}
+                    with self._pending_lock:
+                        # Задачи, ещё не записанные на лист, должны оставаться видимыми
+                        # (неподтверждённые строки могут уже быть на листе — их не дублируем)
+                        records.extend(self._with_deadline(dict(zip(self.header, row)))
+                                       for row in self._pending["tasks"] if str(row[0]) not in sheet_ids)
+                        self._records_cache = records
+                        self._cache_ts = time.monotonic()
+        return self._records_cache
+
+    def _cached_records(self):
+        """Текущий кэш без обращения к сети (для чтения из цикла событий)."""
+        return self._records_cache or []
+
+    @staticmethod
+    def _with_deadline(record):
+        """Добавляет в запись разобранный срок выполнения (_deadline_dt), чтобы не парсить его при каждом запросе."""
+        try:
+            record["_deadline_dt"] = datetime.datetime.strptime(record["Срок Выполнения (план)"], "%Y-%m-%d %H:%M:%S")
+        except (KeyError, TypeError, ValueError):
+            record["_deadline_dt"] = None
+        return record
+
+    def _records_fresh(self, max_age=30):
+        return self._records_cache is not None and time.monotonic() - self._cache_ts <= max_age
+
+    async def _refresh_records(self):
+        """Перечитывает устаревший кэш в отдельном потоке, не блокируя цикл событий.
+
+        При ошибке остаётся прежний кэш (или пустой список), как и раньше при сбое чтения листа.
+        """
+        if self.tasks_sheet and not self._records_fresh():
+            try:
+                await asyncio.to_thread(self._get_records)
+            except Exception as e:
+                logger.error(f"Error refreshing tasks cache: {e}")
+
+    def _enqueue(self, key, row, record=None):
+        """Ставит строку в очередь на запись и при необходимости запускает фоновую отправку.
+
+        record (для задач) добавляется в кэш под той же блокировкой, чтобы очередь и кэш не расходились.
+        """
+        with self._pending_lock:
+            self._pending[key].append(row)
+            if record is not None and self._records_cache is not None:
+                self._records_cache.append(record)
+        if self._flusher_task is None:
+            self._flusher_task = asyncio.get_running_loop().create_task(self._flusher())
+
+    async def _flusher(self, interval=1):
+        while True:
+            await asyncio.sleep(interval)
+            if any(self._pending.values()):
+                await asyncio.to_thread(self.flush_pending)
+
+    def flush_pending(self, retry=True):
+        """Отправляет накопленные строки: один append_rows на каждый лист.
+
+        retry=False (при остановке бота) — одна попытка без пауз, неотправленное только логируется.
+        """
+        attempts = _SHEETS_MAX_RETRIES if retry else 1
+        sheets = {"tasks": self.tasks_sheet, "offtopic": self.offtopic_sheet, "complaints": self.complaints_sheet}
+        with self._write_lock:
+            for key, worksheet in sheets.items():
+                with self._pending_lock:
+                    rows, self._pending[key] = self._pending[key], []
+                    unconfirmed, self._unconfirmed[key] = self._unconfirmed[key], 0
+                if not rows or not worksheet:
+                    continue
+                retry_rows, retry_unconfirmed = self._flush_sheet(key, worksheet, rows, unconfirmed, attempts)
+                if retry_rows and not retry:
+                    logger.error(f"Unsent rows for {worksheet.title} at shutdown: {retry_rows}")
+                elif retry_rows:
+                    # Возвращаем строки в начало очереди для следующей попытки
+                    with self._pending_lock:
+                        self._pending[key][:0] = retry_rows
+                        self._unconfirmed[key] = retry_unconfirmed
+
+    def _flush_sheet(self, key, worksheet, rows, unconfirmed, attempts=_SHEETS_MAX_RETRIES):
+        """Отправляет очередь одного листа, возвращает (строки для повтора, сколько из них с неизвестным исходом)."""
+        if unconfirmed:
+            try:
+                rows = self._unwritten_rows(key, worksheet, rows[:unconfirmed], attempts) + rows[unconfirmed:]
+            except Exception as e:
+                logger.error(f"Could not check earlier rows on {worksheet.title}, will retry: {e}")
+                return rows, unconfirmed
+            if not rows:
+                return [], 0
         try:
-            records = self.tasks_sheet.get_all_records()
-            return max((int(r.get("ID Задачи", 0)) for r in records), default=0) + 1
+            with_backoff(worksheet.append_rows, idempotent=False, attempts=attempts)(rows, value_input_option="RAW")
+            logger.info(f"Flushed {len(rows)} rows to {worksheet.title}")
+            return [], 0
+        except Exception as e:
+            retry = self._retry_after_append_error(key, worksheet, rows, e)
+            if retry:
+                return retry
+            # Лист отверг пакет: отправляем по одной строке, чтобы потерять только отклонённые
+            logger.error(f"Batch for {worksheet.title} rejected, sending rows one by one: {e}")
+
+        dropped = False
+        for i, row in enumerate(rows):
+            try:
+                with_backoff(worksheet.append_rows, idempotent=False, attempts=attempts)([row], value_input_option="RAW")
+            except Exception as e:
+                retry = self._retry_after_append_error(key, worksheet, rows[i:], e)
+                if retry:
+                    # Неотправленный остаток целиком уходит на повтор; неясным может быть только текущая строка
+                    return retry[0], min(retry[1], 1)
+                logger.error(f"Dropped row for {worksheet.title}: {e}; row: {row}")
+                dropped = True
+        if dropped and key == "tasks":
+            # В кэше остались задачи, которых нет на листе, — перечитываем его
+            with self._pending_lock:
+                self._records_cache = None
+        return [], 0
+
+    def _retry_after_append_error(self, key, worksheet, rows, e):
+        """Для временной ошибки возвращает (строки для повтора, сколько из них с неизвестным исходом), иначе None."""
+        if _is_ambiguous_append_error(e):
+            # Строки могли записаться: перед повтором сверим их с листом
+            logger.error(f"Error flushing rows to {worksheet.title}, will check and retry: {e}")
+            if key == "tasks":
+                with self._pending_lock:
+                    self._records_cache = None
+            return rows, len(rows)
+        if _is_transient_sheets_error(e):
+            logger.error(f"Error flushing rows to {worksheet.title}, will retry: {e}")
+            return rows, 0
+        return None
+
+    def _unwritten_rows(self, key, worksheet, rows, attempts=_SHEETS_MAX_RETRIES):
+        """Возвращает строки из оборвавшейся отправки, которых на листе нет."""
+        first_col = with_backoff(worksheet.col_values, attempts=attempts)(1)
+        if key == "tasks":
+            positions = {value: i for i, value in enumerate(first_col, 1)}
+            written = [(positions[str(row[0])], row) for row in rows if str(row[0]) in positions]
+            if written:
+                # Перезаписываем строки целиком: пока они ждали в очереди, их мог изменить update_task_status
+                with_backoff(worksheet.batch_update, attempts=attempts)([
+                    {"range": f"{gspread.utils.rowcol_to_a1(i, 1)}:{gspread.utils.rowcol_to_a1(i, len(row))}", "values": [row]}
+                    for i, row in written
+                ])
+            return [row for row in rows if str(row[0]) not in positions]
+
+        # Логи только дописываются: если хвост листа совпадает со строками, они уже записаны
+        def normalize(row):
+            values = [str(v) for v in row]
+            while values and values[-1] == "":
+                values.pop()
+            return values
+
+        start = len(first_col) - len(rows) + 1
+        if start < 2:
+            return rows
+        tail = with_backoff(worksheet.get_values, attempts=attempts)(f"{start}:{len(first_col)}")
+        if [normalize(r) for r in tail] == [normalize(r) for r in rows]:
+            return []
+        return rows
+
+    def _load_next_task_id(self):
+        try:
+            # Достаточно одной колонки ID вместо всех записей листа
+            ids = with_backoff(self.tasks_sheet.col_values)(1)[1:]
+            return max((int(x) for x in ids if x.isdigit()), default=0) + 1
         except Exception as e:
             logger.error(f"Error getting next task ID: {e}")
-            return 1
-    def add_task(self, task_description, task_category, deadline_plan, message_id, user_id, user_name):
+            return None
+
+    def _ensure_next_task_id(self):
+        """Повторно читает счётчик ID, если при старте это не удалось."""
+        with self._task_id_lock:
+            if self._next_task_id is None:
+                self._next_task_id = self._load_next_task_id()
+
+    def _get_next_task_id(self):
+        with self._task_id_lock:
+            if self._next_task_id is None:
+                return None
+            task_id = self._next_task_id
+            self._next_task_id += 1
+            return task_id
+
+    async def add_task(self, task_description, task_category, deadline_plan, message_id, user_id, user_name):
+        if self.tasks_sheet and self._next_task_id is None:
+            await asyncio.to_thread(self._ensure_next_task_id)
+        return self._sync_add_task(task_description, task_category, deadline_plan, message_id, user_id, user_name)
+
+    def _sync_add_task(self, task_description, task_category, deadline_plan, message_id, user_id, user_name):
         if not self.tasks_sheet:
             logger.warning("Google Sheets not available. Task not added.")
             return None, False
         try:
             task_id = self._get_next_task_id()
+            if task_id is None:
+                # Без актуального максимального ID новые задачи получили бы ID существующих
+                logger.error("Next task ID unknown, sheet could not be read. Task not added.")
+                return None, False
             date_created = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             status = "Новая"
             row = [task_id, task_description, date_created, task_category, deadline_plan, status,
-                   BOT_DATA.get("sysadmin_telegram_id", "Не назначен"), "", str(message_id),
+                   BOT_DATA.sysadmin_telegram_id or "Не назначен", "", str(message_id),
                    f"{user_name} ({user_id})", ""]
-            self.tasks_sheet.append_row(row)
+            self._enqueue("tasks", row, self._with_deadline(dict(zip(self.header, row))))
             logger.info(f"Task {task_id} added: {task_description}")
             return task_id, True
         except Exception as e:
             logger.error(f"Error adding task: {e}")
             return None, False
 
-    def find_task_row(self, task_id_str):
-        if not self.tasks_sheet:
-            return None
+    def _find_task(self, task_id_str, records):
+        """Ищет задачу в снимке записей, возвращает (номер строки на листе, запись) или (None, None)."""
         try:
-            task_id = int(task_id_str.strip())
-            records = self.tasks_sheet.get_all_records()
+            task_id = int(str(task_id_str).strip())
             for i, record in enumerate(records, 2):
                 if int(record.get("ID Задачи", 0)) == task_id:
-                    return i
+                    return i, record
             logger.warning(f"Task ID {task_id} not found.")
-            return None
         except ValueError:
             logger.warning(f"Invalid task ID format: {task_id_str}")
-            return None
+        return None, None
+
+    def _row_holds_task(self, row_index, task_id):
+        """Проверяет по колонке ID, что на строке row_index листа действительно задача task_id."""
+        ids = with_backoff(self.tasks_sheet.col_values)(1)
+        return row_index <= len(ids) and ids[row_index - 1] == str(task_id)
 
-    def update_task_status(self, task_id_str, new_status, sysadmin_id_on_done=None):
+    async def update_task_status(self, task_id_str, new_status, sysadmin_id_on_done=None):
+        return await asyncio.to_thread(self._sync_update_task_status, task_id_str, new_status, sysadmin_id_on_done)
+
+    def _sync_update_task_status(self, task_id_str, new_status, sysadmin_id_on_done=None):
         if not self.tasks_sheet:
             return False
-        row_index = self.find_task_row(task_id_str)
-        if not row_index:
-            return False
         try:
-            self.tasks_sheet.update_cell(row_index, 6, new_status)
-            if new_status == "Выполнена" and sysadmin_id_on_done:
-                self.tasks_sheet.update_cell(row_index, 8, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-                executor = self.tasks_sheet.cell(row_index, 7).value
-                if not executor or executor == "Не назначен":
-                    self.tasks_sheet.update_cell(row_index, 7, str(sysadmin_id_on_done))
+            # Поиск строки и запись под _write_lock: кэш не обновится и очередь не уйдёт на лист между ними
+            with self._write_lock:
+                row_index, record = self._find_task(task_id_str, self._get_records())
+                if not row_index:
+                    return False
+                with self._pending_lock:
+                    pending_row = next((r for r in self._pending["tasks"] if r[0] == record.get("ID Задачи")), None)
+                if not pending_row and not self._row_holds_task(row_index, record.get("ID Задачи")):
+                    # Кэш не совпадает с листом (строки вставляли, удаляли или сортировали вручную)
+                    row_index, record = self._find_task(task_id_str, self._get_records(max_age=0))
+                    if not row_index:
+                        return False
+                changes = {"Статус": new_status}
+                if new_status == "Выполнена" and sysadmin_id_on_done:
+                    changes["Дата Факт. Выполнения"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    executor = record.get("Исполнитель (ID)")
+                    if not executor or executor == "Не назначен":
+                        changes["Исполнитель (ID)"] = str(sysadmin_id_on_done)
+
+                if pending_row:
+                    # Строка ещё в очереди: правим её, на лист она уйдёт уже обновлённой
+                    with self._pending_lock:
+                        for name, value in changes.items():
+                            pending_row[self.header.index(name)] = value
+                else:
+                    with_backoff(self.tasks_sheet.batch_update)([
+                        {"range": gspread.utils.rowcol_to_a1(row_index, self.header.index(name) + 1), "values": [[value]]}
+                        for name, value in changes.items()
+                    ])
+                with self._pending_lock:
+                    record.update(changes)
             logger.info(f"Task {task_id_str} status updated to {new_status}")
             return True
         except Exception as e:
             logger.error(f"Error updating task {task_id_str}: {e}")
             return False
-    def get_task_info(self, task_id_str):
+    async def get_task_info(self, task_id_str):
+        await self._refresh_records()
+        return self._sync_get_task_info(task_id_str)
+
+    def _sync_get_task_info(self, task_id_str):
         if not self.tasks_sheet:
             return None
-        row_index = self.find_task_row(task_id_str)
-        if not row_index:
-            return None
-        try:
-            return dict(zip(self.header, self.tasks_sheet.row_values(row_index)))
-        except Exception as e:
-            logger.error(f"Error getting task {task_id_str} info: {e}")
+        _, record = self._find_task(task_id_str, self._cached_records())
+        if not record:
             return None
+        # Копия записи из кэша: её может одновременно менять update_task_status
+        with self._pending_lock:
+            return dict(record)
 
-    def get_active_tasks(self):
+    def _sync_get_active_tasks(self):
         if not self.tasks_sheet:
             return []
-        try:
-            return [r for r in self.tasks_sheet.get_all_records()
-                    if r.get("Статус") not in ["Выполнена", "Отменена"]]
-        except Exception as e:
-            logger.error(f"Error getting active tasks: {e}")
-            return []
-
-    def calculate_remaining_time(self, task_id_str):
-        task = self.get_task_info(task_id_str)
-        if not task or not task.get("Срок Выполнения (план)"):
+        return [r for r in self._cached_records()
+                if r.get("Статус") not in ["Выполнена", "Отменена"]]
+
+    @staticmethod
+    def format_remaining_time(task, now=None):
+        """Оставшееся до срока время задачи (запись из get_task_info) или None, если срок не указан."""
+        deadline = task.get("_deadline_dt")
+        if not deadline:
             return None
-        deadline = datetime.datetime.strptime(task["Срок Выполнения (план)"], "%Y-%m-%d %H:%M:%S")
-        now = datetime.datetime.now()
+        now = now or datetime.datetime.now()
         time_diff = deadline - now
         if time_diff.total_seconds() <= 0:
             return "Время истекло"
@@ -218,14 +579,31 @@ class GoogleSheetsManager:
         minutes = int((time_diff.total_seconds() % 3600) / 60)
         return f"{hours} часов {minutes} минут"
 
+    async def render_active_tasks(self):
+        await self._refresh_records()
+        return self._sync_render_active_tasks()
+
+    def _sync_render_active_tasks(self):
+        """Формирует Markdown-список активных задач за один проход по кэшу."""
+        tasks = self._sync_get_active_tasks()
+        if not tasks:
+            return "📋 Активных задач нет."
+        now = datetime.datetime.now()
+        response = "📋 *Активные задачи:*\n\n"
+        for task in tasks:
+            remaining_time = self.format_remaining_time(task, now)
+            response += f"• ID: {task['ID Задачи']} - {task['Описание Задачи']}\n"
+            response += f"  Категория: {task['Категория']}, Осталось: {remaining_time or 'Не указано'}\n\n"
+        return response
+
     def log_offtopic_message(self, user_id, user_name, message_text):
         if not self.offtopic_sheet:
             logger.warning("Google Sheets not available. Offtopic message not logged.")
             return
         try:
             row = [datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), user_id, user_name, message_text]
-            self.offtopic_sheet.append_row(row)
-            logger.info(f"Offtopic message logged: {message_text}")
+            self._enqueue("offtopic", row)
+            logger.debug(f"Offtopic message logged: {message_text}")
         except Exception as e:
             logger.error(f"Error logging offtopic message: {e}")
 
@@ -235,12 +613,15 @@ class GoogleSheetsManager:
             return
         try:
             row = [datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), user_id, user_name, complaint_text, related_message or ""]
-            self.complaints_sheet.append_row(row)
+            self._enqueue("complaints", row)
             logger.info(f"Complaint logged: {complaint_text}")
         except Exception as e:
             logger.error(f"Error logging complaint: {e}")
 
 sheets_manager = GoogleSheetsManager(CREDENTIALS_FILE, GOOGLE_SHEET_ID)
+# При остановке один раз пытаемся отправить то, что не успел фоновый _flusher
+# (регистрируется после _log_listener.stop, поэтому выполняется раньше него и его логи попадают в файл)
+atexit.register(sheets_manager.flush_pending, retry=False)
 # Command Handlers
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
@@ -253,6 +634,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /help"""
     user = update.effective_user
+    sysadmin_id = BOT_DATA.sysadmin_telegram_id
     help_text = (
         "Доступные команды:\n"
         "/start - Начать работу с ботом\n"
@@ -261,7 +643,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/status <ID> - Проверить статус задачи\n"
         "/tasks - Показать список активных задач"
     )
-    if BOT_DATA.get("sysadmin_telegram_id") and user.id == BOT_DATA["sysadmin_telegram_id"]:
+    if sysadmin_id is not None and user.id == sysadmin_id:
         help_text += "\n\nКоманды для сисадмина:\n/done <ID> - Отметить задачу выполненной"
     if await check_is_admin(update, context, user.id):
         help_text += "\n\nКоманды для администратора:\n/set_sysadmin <ID или @username> - Назначить системного администратора"
@@ -294,12 +676,12 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     task_id = context.args[0]
-    task = sheets_manager.get_task_info(task_id)
+    task = await sheets_manager.get_task_info(task_id)
     if not task:
         await update.message.reply_text("❌ Задача не найдена.")
         return
 
-    remaining_time = sheets_manager.calculate_remaining_time(task_id)
+    remaining_time = sheets_manager.format_remaining_time(task)
     response = (f"📋 Задача ID {task_id}:\n"
                 f"*{task['Описание Задачи']}*\n\n"
                 f"Категория: {task['Категория']}\n"
@@ -309,23 +691,13 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def tasks_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /tasks"""
-    tasks = sheets_manager.get_active_tasks()
-    if not tasks:
-        await update.message.reply_text("📋 Активных задач нет.", parse_mode="Markdown")
-        return
-
-    response = "📋 *Активные задачи:*\n\n"
-    for task in tasks:
-        task_id = task["ID Задачи"]
-        remaining_time = sheets_manager.calculate_remaining_time(str(task_id))
-        response += f"• ID: {task_id} - {task['Описание Задачи']}\n"
-        response += f"  Категория: {task['Категория']}, Осталось: {remaining_time or 'Не указано'}\n\n"
-    await update.message.reply_text(response, parse_mode="Markdown")
+    await update.message.reply_text(await sheets_manager.render_active_tasks(), parse_mode="Markdown")
 
 async def done_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /done"""
     user = update.effective_user
-    if not BOT_DATA.get("sysadmin_telegram_id") or user.id != BOT_DATA["sysadmin_telegram_id"]:
+    sysadmin_id = BOT_DATA.sysadmin_telegram_id
+    if sysadmin_id is None or user.id != sysadmin_id:
         await update.message.reply_text("❌ Эта команда доступна только системному администратору.")
         return
 
@@ -334,12 +706,12 @@ async def done_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     task_id = context.args[0]
-    if sheets_manager.update_task_status(task_id, "Выполнена", user.id):
+    if await sheets_manager.update_task_status(task_id, "Выполнена", user.id):
         await update.message.reply_text(f"✅ Задача ID {task_id} отмечена как выполненная.", parse_mode="Markdown")
         try:
-            task = sheets_manager.get_task_info(task_id)
+            task = await sheets_manager.get_task_info(task_id)
             if task:
-                creator_id_match = re.search(r'\((\d+)\)$', task["ID Постановщика Задачи"])
+                creator_id_match = _CREATOR_ID_RE.search(task["ID Постановщика Задачи"])
                 if creator_id_match:
                     creator_id = int(creator_id_match.group(1))
                     await context.bot.send_message(
@@ -366,7 +738,7 @@ async def set_sysadmin_command(update: Update, context: ContextTypes.DEFAULT_TYP
     target = context.args[0]
     if target.startswith('@'):
         # Сохраняем username, ID будет получен позже
-        BOT_DATA["sysadmin_telegram_username"] = target[1:]
+        BOT_DATA.sysadmin_telegram_username = target[1:]
         await update.message.reply_text(
             f"✅ @{target[1:]} установлен как системный администратор.\n"
             f"Для завершения настройки, пользователь должен отправить /iam_sysadmin"
@@ -374,7 +746,7 @@ async def set_sysadmin_command(update: Update, context: ContextTypes.DEFAULT_TYP
     else:
         try:
             sysadmin_id = int(target)
-            BOT_DATA["sysadmin_telegram_id"] = sysadmin_id
+            BOT_DATA.sysadmin_telegram_id = sysadmin_id
             await update.message.reply_text(f"✅ Пользователь с ID {sysadmin_id} установлен как системный администратор.")
         except ValueError:
             await update.message.reply_text("❌ Неверный формат ID. Используйте числовой ID или @username.")
@@ -382,21 +754,42 @@ async def set_sysadmin_command(update: Update, context: ContextTypes.DEFAULT_TYP
 async def iam_sysadmin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /iam_sysadmin"""
     user = update.effective_user
-    if user.username and user.username.lower() == BOT_DATA.get("sysadmin_telegram_username", "").lower():
-        BOT_DATA["sysadmin_telegram_id"] = user.id
-        BOT_DATA["sysadmin_telegram_username"] = user.username
+    if user.username and user.username.lower() == (BOT_DATA.sysadmin_telegram_username or "").lower():
+        BOT_DATA.sysadmin_telegram_id = user.id
+        BOT_DATA.sysadmin_telegram_username = user.username
         await update.message.reply_text("✅ Вы успешно установлены как системный администратор.")
     else:
         await update.message.reply_text("❌ Вы не назначены системным администратором.")
 # Helper functions
+# Кэш статуса администратора: (chat_id, user_id) -> (время проверки, результат),
+# упорядочен по времени проверки, чтобы устаревшие записи удалялись с начала
+_admin_cache: "OrderedDict[tuple[int, int], tuple[float, bool]]" = OrderedDict()
+_ADMIN_CACHE_TTL = 60
+
 async def check_is_admin(update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int) -> bool:
+    key = (update.effective_chat.id, user_id)
+    now = time.monotonic()
+    hit = _admin_cache.get(key)
+    if hit and now - hit[0] < _ADMIN_CACHE_TTL:
+        return hit[1]
     try:
         chat_member = await context.bot.get_chat_member(update.effective_chat.id, user_id)
-        return chat_member.status in ["creator", "administrator"]
+        is_admin = chat_member.status in ["creator", "administrator"]
+        _admin_cache[key] = (now, is_admin)
+        _admin_cache.move_to_end(key)
+        while _admin_cache and now - next(iter(_admin_cache.values()))[0] >= _ADMIN_CACHE_TTL:
+            _admin_cache.popitem(last=False)
+        return is_admin
     except Exception as e:
         logger.error(f"Error checking admin status: {e}")
         return False
 
+async def chat_member_updated(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработчик ChatMemberHandler: сбрасывает кэш статуса администратора"""
+    member_update = update.chat_member or update.my_chat_member
+    if member_update:
+        _admin_cache.pop((member_update.chat.id, member_update.new_chat_member.user.id), None)
+
 async def get_rules_text():
     return (
         "📜 *Правила чата IT Oiltech*\n\n"
@@ -417,8 +810,13 @@ async def get_rules_text():
 async def notify_admins(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message: str):
     try:
         admins = await context.bot.get_chat_administrators(chat_id)
-        for admin in admins:
-            await context.bot.send_message(admin.user.id, message, parse_mode="Markdown")
+        results = await asyncio.gather(
+            *(context.bot.send_message(admin.user.id, message, parse_mode="Markdown") for admin in admins),
+            return_exceptions=True
+        )
+        for admin, result in zip(admins, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to notify admin {admin.user.id}: {result}")
     except Exception as e:
         logger.error(f"Failed to notify admins: {e}")
 
@@ -426,53 +824,47 @@ async def get_gpt_analysis(text_message: str) -> dict:
     if not openai_client:
         return {"category": "📌 Другое / Не по теме", "action": "offtopic"}
 
-    prompt = """
-    Ты — интеллектуальный агент, виртуальный администратор группы IT Oiltech компании SRL Oiltech.
-    Твоя цель: контролировать тематическую чистоту чата (разрешены только вопросы, связанные с технической поддержкой, ИТ-инфраструктурой и обслуживанием), определять категорию сообщения и действие, которое нужно выполнить.
-
-    Как ты работаешь:
-    1. Получаешь сообщение из группы.
-    2. Извлекаешь суть, игнорируя имена, обращения и ненужные детали.
-    3. Определяешь категорию сообщения из списка ниже.
-    4. Определяешь действие на основе контекста:
-       - "create_task": Создать задачу для ИТ-тематики.
-       - "check_status": Проверить статус задач (если запрашивается, например, "Задача выполнена" или "ID 123 готово").
-       - "mark_done": Отметить задачу как выполненную (если указано, например, "Задача выполнена" или "ID 123 готово").
-       - "offtopic": Сообщение не по теме, удалить и уведомить пользователя.
-       - "show_rules": Показать правила чата (если запрошены, например, "Какие темы можно обсуждать?").
-       - "complain": Обработать жалобу (если содержит "жалоба", "проблема с модерацией").
-    5. Возвращаешь JSON с категорией и действием, например:
-       {"category": "🖨 Принтер / Сканер / Картриджи", "action": "create_task", "entities": {"description": "Принтер не печатает"}}
-       {"category": "📌 Другое / Не по теме", "action": "offtopic"}
-       {"category": "📌 Другое / Не по теме", "action": "show_rules"}
-       {"category": "📌 Другое / Не по теме", "action": "complain", "entities": {"complaint_text": "Жалоба на модерацию"}}
-
-    Запрещено в чате:
-    - Разговоры не по теме (погода, обсуждения, конфликты, жалобы, личные разговоры).
-    - Мемы, шутки, флуд, голосовые сообщения.
-    - Просьбы без ИТ-содержания.
-
-    Категории:
-    - 📨 Почта / Office / Outlook / Teams (почта, Teams, Office365)
-    - 🖨 Принтер / Сканер / Картриджи (проблемы с принтерами, сканерами, картриджами)
-    - 💾 Программы (1С, AutoCAD, др.) (установка, обновление, ошибки)
-    - 🔧 Компьютеры и ноутбуки (устройства, драйверы, мониторы, периферия)
-    - 🌐 Интернет / Сеть / Кабели (интернет, Wi-Fi, кабели, порты)
-    - 🚪 Пропуска / СКУД / Видеонаблюдение (доступ, камеры, турникеты)
-    - 👤 Доступы / Учетки / Замена сотрудников (учётные записи, пароли)
-    - 📌 Другое / Не по теме (флуд, личные вопросы, оффтоп)
-    """
+    key = text_message.strip().lower()[:500]
+    if key in _gpt_cache:
+        _gpt_cache.move_to_end(key)
+        return _gpt_cache[key]
+
     try:
-        response = await openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "system", "content": prompt}, {"role": "user", "content": text_message}],
-            response_format={"type": "json_object"}
-        )
-        return json.loads(response.choices[0].message.content)
+        # Полный анализ gpt-4o нужен только сообщениям, которые дешёвый классификатор счёл ИТ-тематикой
+        if await quick_classify(text_message) == "offtopic":
+            result = {"category": "📌 Другое / Не по теме", "action": "offtopic"}
+        else:
+            response = await openai_client.chat.completions.create(
+                model="gpt-4o",
+                messages=[{"role": "system", "content": GPT_SYSTEM_PROMPT}, {"role": "user", "content": text_message}],
+                response_format={"type": "json_object"}
+            )
+            result = json_loads(response.choices[0].message.content)
     except Exception as e:
         logger.error(f"OpenAI error for '{text_message}': {e}")
         return {"category": "📌 Другое / Не по теме", "action": "offtopic"}
 
+    _gpt_cache[key] = result
+    if len(_gpt_cache) > _GPT_MAX:
+        _gpt_cache.popitem(last=False)
+    return result
+
+async def quick_classify(text_message: str) -> Literal["it", "offtopic"]:
+    """Дешёвая предварительная классификация через gpt-4o-mini: ИТ-сообщение или оффтоп"""
+    try:
+        response = await openai_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[{"role": "system", "content": QUICK_CLASSIFY_PROMPT}, {"role": "user", "content": text_message}],
+            max_tokens=4,
+            temperature=0
+        )
+        answer = (response.choices[0].message.content or "").strip().lower()
+        return "offtopic" if answer.startswith("offtopic") else "it"
+    except Exception as e:
+        # При ошибке не отбрасываем сообщение — его разберёт полный анализ
+        logger.error(f"Quick classification failed for '{text_message}': {e}")
+        return "it"
+
 # Keyboard Helpers
 def get_main_keyboard(is_sysadmin=False, is_admin=False):
     keyboard = [[KeyboardButton("📋 Список задач")]]
@@ -493,7 +885,8 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     # Проверка, является ли пользователь админом
     is_admin = await check_is_admin(update, context, user.id)
-    is_sysadmin = BOT_DATA.get("sysadmin_telegram_id") and user.id == BOT_DATA["sysadmin_telegram_id"]
+    sysadmin_id = BOT_DATA.sysadmin_telegram_id
+    is_sysadmin = sysadmin_id is not None and user.id == sysadmin_id
 
     # Обработка уточнения задачи
     if context.user_data.get("awaiting_task_description"):
@@ -521,7 +914,8 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     # Отслеживание нарушений
     if category == "📌 Другое / Не по теме" and not is_admin:
-        BOT_DATA["user_violations"][user.id] = BOT_DATA["user_violations"].get(user.id, 0) + 1
+        violations = BOT_DATA.user_violations
+        violations[user.id] = violations.get(user.id, 0) + 1
         sheets_manager.log_offtopic_message(user.id, user.full_name, text)
         try:
             if (await context.bot.get_chat_member(update.effective_chat.id, context.bot.id)).can_delete_messages:
@@ -533,7 +927,7 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
                     [InlineKeyboardButton("📜 Правила чата", callback_data="show_rules")]
                 ])
             )
-            if BOT_DATA["user_violations"][user.id] >= 3:
+            if violations[user.id] >= 3:
                 await context.bot.send_message(user.id, await get_rules_text(), parse_mode="Markdown")
         except Exception as e:
             logger.error(f"Failed to handle offtopic message: {e}")
@@ -552,27 +946,17 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         return CONFIRM_TASK
 
     elif action == "check_status" and is_admin:
-        tasks = sheets_manager.get_active_tasks()
-        if not tasks:
-            await update.message.reply_text("📋 Активных задач нет.", parse_mode="Markdown")
-            return
-        response = "📋 *Активные задачи:*\n\n"
-        for task in tasks:
-            task_id = task["ID Задачи"]
-            remaining_time = sheets_manager.calculate_remaining_time(str(task_id))
-            response += f"• ID: {task_id} - {task['Описание Задачи']}\n"
-            response += f"  Категория: {task['Категория']}, Осталось: {remaining_time or 'Не указано'}\n\n"
-        await update.message.reply_text(response, parse_mode="Markdown")
+        await update.message.reply_text(await sheets_manager.render_active_tasks(), parse_mode="Markdown")
         return
 
     elif action == "mark_done" and is_sysadmin:
         task_id = entities.get("task_id")
-        if task_id and sheets_manager.update_task_status(task_id, "Выполнена", user.id):
+        if task_id and await sheets_manager.update_task_status(task_id, "Выполнена", user.id):
             await update.message.reply_text(f"✅ Задача ID {task_id} отмечена как выполненная.", parse_mode="Markdown")
             try:
-                task = sheets_manager.get_task_info(task_id)
+                task = await sheets_manager.get_task_info(task_id)
                 if task:
-                    creator_id_match = re.search(r'\((\d+)\)$', task["ID Постановщика Задачи"])
+                    creator_id_match = _CREATOR_ID_RE.search(task["ID Постановщика Задачи"])
                     if creator_id_match:
                         creator_id = int(creator_id_match.group(1))
                         await context.bot.send_message(